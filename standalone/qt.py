@@ -15,19 +15,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import matplotlib
-matplotlib.use('Qt5Agg')
-
 from PyQt5 import QtCore, QtWidgets, QtGui
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
 import traceback
 import time
 
 import numpy as np
 π = np.pi
 import os, sys
-from scipy import optimize
+import cmath, math
+import functools
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+# pandas is only used to load CSV files, and is slow to import, so just
+#   check that it exists here
+HAS_PANDAS = importlib.util.find_spec('pandas') is not None
+
+try:
+    import numexpr
+except ImportError:
+    HAS_NUMEXPR = False
+else:
+    HAS_NUMEXPR = True
+
+try:
+    import numba
+except ImportError:
+    HAS_NUMBA = False
+else:
+    HAS_NUMBA = True
 
 try:
     import vxi11
@@ -38,23 +54,160 @@ else:
     HAS_VXI11 = True
 
 
+if HAS_NUMBA:
+    @numba.njit(parallel=True, fastmath=True)
+    def _harmonic_sums(t, sig, ω0, ϕ0, harmonics, blocks):
+        # Σ sig exp(-i n (ω0 t + ϕ0)) for n = 1...harmonics; the samples are
+        #   split into blocks which are summed in parallel, and the higher
+        #   harmonics are generated by repeated multiplication.
+        N = len(t)
+        partial = np.zeros((blocks, harmonics), dtype=np.complex128)
+
+        for b in numba.prange(blocks):
+            for k in range(b*N//blocks, (b+1)*N//blocks):
+                z = cmath.exp(-1j * (ω0*t[k] + ϕ0))
+                zn = sig[k] * z
+                for n in range(harmonics):
+                    partial[b, n] += zn
+                    zn *= z
+
+        return partial.sum(axis=0)
+
+    @numba.njit(parallel=True, fastmath=True)
+    def _harmonic_reconstruct(t, c, ω0, ϕ0):
+        # Re[Σ c[n-1] z^n], z = exp(i (ω0 t + ϕ0)), using Horner's rule
+        x = np.empty(len(t))
+
+        for k in numba.prange(len(t)):
+            z = cmath.exp(1j * (ω0*t[k] + ϕ0))
+            y = 0j
+            for n in range(len(c)-1, -1, -1):
+                y = (y + c[n]) * z
+            x[k] = y.real
+
+        return x
+
+
 def cosine_fit(t, x0, A, ω, ϕ):
+    if HAS_NUMEXPR and isinstance(t, np.ndarray):
+        # Single pass over t, with no temporary arrays
+        return numexpr.evaluate('x0 + A * cos(w * t + p)',
+            local_dict={'t': t, 'x0': x0, 'A': A, 'w': ω, 'p': ϕ})
+
     return x0 + A * np.cos(ω * t + ϕ)
 
+def cosine_fit_jac(t, x0, A, ω, ϕ):
+    # Analytic Jacobian of cosine_fit w.r.t. (x0, A, ω, ϕ)
+    θ = ω * t + ϕ
+    c, s = np.cos(θ), np.sin(θ)
+    return np.stack([np.ones_like(t), c, -A * t * s, -A * s], axis=1)
+
+@functools.lru_cache(maxsize=8)
+def _get_window(N, window=np.hanning):
+    '''Return a window normalized so that it sums to 2, for use in
+    find_harmonics.  Results are cached, so the returned array is read-only.
+
+    Parameters
+    ----------
+    N : number of points
+    window : either a function which returns a window of length N (e.g.
+        np.hanning), or a name accepted by scipy.signal.get_window
+    '''
+    if isinstance(window, str):
+        from scipy.signal import get_window
+        w = get_window(window, N, fftbins=False)
+    else:
+        w = window(N)
+    w = w * (2 / w.sum())
+    w.flags.writeable = False
+    return w
+
+class Harmonics(dict):
+    '''Harmonics of a signal, as returned by find_harmonics.
+
+    The fit is stored as parallel arrays, where index 0 is the reference
+    signal and index n is harmonic n.  For compatibility, this is also a
+    dictionary with the keys 'num harmonics', 'ref offset', 'ref A',
+    'ref ω', 'ref ϕ', 'ref error', 'ω{n}', 'A~{n}', 'A{n}' and 'ϕ{n}'; these
+    are a snapshot of the arrays, and are not updated if the arrays change.
+
+    The reference fit is normalized so that its amplitude is positive; if
+    ref_A < 0, it is negated and π is added to ref_ϕ.  The harmonic phases
+    are measured relative to ref_ϕ, so they are corrected to match.
+
+    Attributes
+    ----------
+    num_harmonics : number of harmonics of the signal
+    omega : angular frequencies
+    A : amplitudes
+    phi : phases
+    A_complex : complex amplitudes, A * exp(i phi)
+    ref_offset, ref_A, ref_error : offset, amplitude and RMS error of the
+        cosine fit to the reference signal
+    '''
+    def __init__(self, ref_offset, ref_A, ref_ω, ref_ϕ, ref_error, A_n):
+        self.num_harmonics = len(A_n)
+
+        if ref_A < 0:
+            # Shifting ref_ϕ by π changes the phase of harmonic n by nπ
+            ref_A = -ref_A
+            ref_ϕ = (ref_ϕ + π) % (2*π)
+            A_n = A_n * (-1)**np.arange(1, self.num_harmonics + 1)
+
+        self.ref_offset = ref_offset
+        self.ref_A = ref_A
+        self.ref_error = ref_error
+
+        self.A_complex = np.empty(self.num_harmonics + 1, dtype='c16')
+        self.A_complex[0] = ref_A * np.exp(1j * ref_ϕ)
+        self.A_complex[1:] = A_n
+
+        self.omega = np.arange(self.num_harmonics + 1) * ref_ω
+        self.omega[0] = ref_ω
+        self.A = np.abs(self.A_complex)
+        self.phi = np.angle(self.A_complex)
+        self.phi[0] = ref_ϕ
+
+        super().__init__({
+            'num harmonics': self.num_harmonics,
+            'ref offset': ref_offset,
+            'ref A': ref_A,
+            'ref ω': ref_ω,
+            'ref ϕ': ref_ϕ,
+            'ref error': ref_error,
+        })
+
+        for n in range(1, self.num_harmonics + 1):
+            self[f'ω{n}'] = self.omega[n]
+            self[f'A~{n}'] = self.A_complex[n]
+            self[f'A{n}'] = self.A[n]
+            self[f'ϕ{n}'] = self.phi[n]
+
+    @classmethod
+    def from_dict(cls, d):
+        '''Convert a dictionary with the keys of find_harmonics (e.g. from an
+        older version of this module) to a Harmonics object.  Harmonics
+        objects are returned unchanged.'''
+        if isinstance(d, cls):
+            return d
+        A_n = np.array([d[f'A~{n}'] for n in range(1, d['num harmonics'] + 1)])
+        return cls(d['ref offset'], d['ref A'], d['ref ω'], d['ref ϕ'],
+            d['ref error'], A_n)
+
 def find_harmonics(t, ref, signal, harmonics=5, window=np.hanning):
-    d = {"num harmonics":harmonics}
+    # scipy is slow to import, so only load it when it's needed
+    from scipy import optimize, fft
 
     dt = t[1] - t[0]
     N = len(t)
 
     offset = ref.mean()
-    window = window(N)
-    window *= 2 / window.sum()
+    window = _get_window(N, window)
     ref_w = (ref - offset) * window
 
     # FFT of reference
-    ref_f = np.fft.rfft(ref_w)[:N//2]
-    f = np.fft.fftfreq(N, dt)[:N//2]
+    ref_f = fft.rfft(ref_w, workers=-1)
+    f = fft.rfftfreq(N, dt)
 
     # Find strongest frequency, including amplitude and phase
     i = np.argmax(abs(ref_f))
@@ -64,42 +217,92 @@ def find_harmonics(t, ref, signal, harmonics=5, window=np.hanning):
     p0 = (offset, abs(A), ωg, np.angle(A) - ωg * t[0])
 
     # Fit reference signal
-    popt, pconv = optimize.curve_fit(cosine_fit, t, ref, p0)
-
-    # Update data
-    d['ref offset'], d['ref A'], d['ref ω'], d['ref ϕ'] = popt
-    d['ref ϕ'] = d['ref ϕ'] % (2*π)
-    d['ref error'] = (ref - cosine_fit(t, *popt)).std()
+    popt, pconv = optimize.curve_fit(cosine_fit, t, ref, p0, jac=cosine_fit_jac, method='lm')
 
-    ω0, ϕ0 = d['ref ω'], d['ref ϕ']
+    ref_offset, ref_A, ω0, ϕ0 = popt
+    ϕ0 = ϕ0 % (2*π)
+    ref_error = (ref - cosine_fit(t, *popt)).std()
 
     # Windowed signal for analysis
     sig = (signal - signal.mean()) * window
 
-    # Compute harmonics
-    for n in range(1, harmonics + 1):
-        ω = n * ω0
-        d[f'ω{n}'] = ω
-        A = (sig * np.exp(-1j * (ω*t + n*ϕ0))).sum()
-        d[f'A~{n}'] = A
-        d[f'A{n}'] = abs(A)
-        d[f'ϕ{n}'] = np.angle(A)
+    # Compute harmonics as a single matrix-vector product: row n-1 of E is
+    #   exp(-i n (ω0 t + ϕ0)), built by repeated multiplication of the first
+    #   row so only one complex exponential is evaluated per sample.
+    if HAS_NUMBA:
+        A_n = _harmonic_sums(t, sig, ω0, ϕ0, harmonics, numba.get_num_threads())
+    elif harmonics:
+        E = np.empty((harmonics, N), dtype='c16')
+        E[0] = np.exp(-1j * (ω0*t + ϕ0))
+        for n in range(1, harmonics):
+            np.multiply(E[n-1], E[0], out=E[n])
+        # sig is real, so contract it against the (re, im) pairs of E
+        #   directly instead of promoting it to a complex array
+        A_n = (sig @ E.view('f8').reshape(harmonics, N, 2)).view('c16')[:, 0]
+    else:
+        A_n = np.zeros(0, dtype='c16')
+
+    return Harmonics(ref_offset, ref_A, ω0, ϕ0, ref_error, A_n)
+
+def harmonic_reconstruct(t, h):
+    h = Harmonics.from_dict(h)
 
-    return d
+    # Σ A_n cos(n (ω0 t + ϕ0) + ϕ_n) = Re[Σ A_n exp(i ϕ_n) z^n], with
+    #   z = exp(i (ω0 t + ϕ0)); evaluated with Horner's rule so that the
+    #   only transcendental call is the single exponential for z.
+    c = h.A_complex[1:]
 
-def harmonic_reconstruct(t, d):
+    if HAS_NUMBA and isinstance(t, np.ndarray) and t.ndim == 1:
+        return _harmonic_reconstruct(t, c, h.omega[0], h.phi[0])
+
+    if HAS_NUMEXPR and h.num_harmonics:
+        # Build an expression with one term per harmonic, which numexpr
+        #   evaluates in a single pass
+        ld = {'t': t, 'w': h.omega[0]}
+        terms = []
+        for n in range(1, h.num_harmonics + 1):
+            ld[f'A{n}'] = h.A[n]
+            ld[f'p{n}'] = h.phi[n] + n*h.phi[0]
+            terms.append(f'A{n} * cos({n} * w * t + p{n})')
+        return numexpr.evaluate(' + '.join(terms), local_dict=ld)
+
+    z = np.exp(1j * (h.omega[0]*t + h.phi[0]))
     x = 0
-    ϕ0 = d['ref ϕ']
-    for n in range(1, d['num harmonics'] + 1):
-        ω, A, ϕ = d[f'ω{n}'], d[f'A{n}'], d[f'ϕ{n}']
-        x += A * np.cos(ω*t + ϕ + n*ϕ0)
-        if n == 1:
-            label = 'fundamental'
-        else:
-            label = f'harmonic {n}'
-        # print(f'{label:>20s}: A={A:.3f}, ϕ={-ϕ*180/π:.1f}°')
+    for cn in c[::-1]:
+        x = (x + cn) * z
+
+    return np.real(x)
+
+def minmax_decimate(x, y, blocks=2000):
+    '''Reduce the number of points in a curve for plotting, keeping the
+    minimum and maximum of each block so the envelope is preserved.
+
+    Parameters
+    ----------
+    x, y : data arrays
+    blocks : approximate number of blocks to divide the data into (default:
+        2000).  If this would not reduce the number of points, the input is
+        returned unchanged.
+
+    Returns
+    -------
+    x, y : decimated arrays, with two points per block
+    '''
+    N = len(y)
+    r = N // blocks
+    if r <= 2:
+        return x, y
+
+    nb = N // r
+    n = r * nb
+    yb = y[:n].reshape(nb, r)
+    i = np.sort(np.stack([yb.argmin(1), yb.argmax(1)], axis=1), axis=1)
+    i = (i + r * np.arange(nb)[:, np.newaxis]).ravel()
 
-    return x
+    if n < N:
+        i = np.concatenate([i, n + np.unique([y[n:].argmin(), y[n:].argmax()])])
+
+    return x[i], y[i]
 
 def load_osc_csv(fn, offset=True):
     '''Load data from the CSV's generated by the Rigol DS1054.
@@ -121,7 +324,13 @@ def load_osc_csv(fn, offset=True):
     with open(fn) as f:
         f.readline() #The first line is headers, just skip
         parts = f.readline().split(',') #The second line includes the time increment data
-        data = np.loadtxt(f, delimiter=',', usecols=np.arange(len(parts)-2), unpack=True)
+        cols = np.arange(len(parts)-2)
+        if HAS_PANDAS:
+            # Pandas C parser is much faster than loadtxt for long captures
+            import pandas
+            data = pandas.read_csv(f, header=None, usecols=cols, dtype=np.float64).to_numpy().T
+        else:
+            data = np.loadtxt(f, delimiter=',', usecols=cols, unpack=True)
 
     start = float(parts[-2]) #Second to last entry is the time start
     inc = float(parts[-1]) #Last entry is the time increment
@@ -138,6 +347,32 @@ def idn_eth(ip):
     inst.close()
     return reply
 
+def convert_rigol_raw(raw, preamble):
+    '''Convert the reply to a Rigol ":WAV:DATA?" query (in BYTE format) to
+    voltages.
+
+    Parameters
+    ----------
+    raw : bytes returned by the oscilloscope
+    preamble : list of values returned by ":WAV:PRE?" for the same channel
+
+    Returns
+    -------
+    V : float32 array of voltages
+    '''
+    if raw[0:1] != b'#':
+        raise ValueError(f'First byte of raw data should be #, found {chr(raw[0])}')
+    N_head = int(raw[1:2])
+    N_points = int(raw[2:2+N_head])
+
+    # View the payload in place, rather than copying it out with a slice
+    raw = np.frombuffer(raw, dtype='u1', count=N_points, offset=2+N_head)
+
+    # 8 bit samples only have 256 possible values, so convert them with a
+    #   lookup table rather than doing the arithmetic for every point
+    lut = (np.arange(256, dtype='f4') - (preamble[9] + preamble[8])) * preamble[7]
+    return lut[raw]
+
 def load_eth(ip, channels=(1, 2)):
     if not HAS_VXI11:
         raise RuntimeError("VXI11 not installed; can't load data over ethernet!\n(to intall, run: pip install python-vxi11)")
@@ -146,29 +381,31 @@ def load_eth(ip, channels=(1, 2)):
     inst.timeout = 3
 
     inst.write(":STOP")
+    # The waveform format persists across source changes, so only set it once
+    inst.write(":WAV:FORM BYTE")
 
-    data = []
-
-    for channel in channels:
-        inst.write(f":WAV:SOUR CHAN{channel:d}")
-        inst.write(":WAV:FORM BYTE")
-        inst.write(":WAV:DATA?")
+    # Each channel is converted in a worker thread, which overlaps with
+    #   reading the next channel from the scope
+    futures = []
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        for channel in channels:
+            inst.write(f":WAV:SOUR CHAN{channel:d}")
+            inst.write(":WAV:DATA?")
+            raw = inst.read_raw()
 
-        raw = inst.read_raw()
-        if raw[0:1] != b'#':
-            raise ValueError(f'First byte of raw data should be #, found {chr(dat[0])}')
-        N_head = int(raw[1:2])
-        N_points = int(raw[2:2+N_head])
+            # The time axis is shared, but the vertical scale (preamble[7:10])
+            #   depends on the channel, so the preamble is read for each source
+            preamble = list(map(float, inst.ask(':WAV:PRE?').split(',')))
+            if not futures:
+                t_preamble = preamble
 
-        raw = np.frombuffer(raw[2+N_head:2+N_head+N_points], dtype='u1')
+            futures.append(pool.submit(convert_rigol_raw, raw, preamble))
 
-        preamble = list(map(float, inst.ask(':WAV:PRE?').split(',')))
+        data = [future.result() for future in futures]
 
-        if not data:
-            # If we haven't already, write a time channel to the output
-            data.append((np.arange(len(raw)) - (preamble[6] + preamble[5])) * preamble[4])
-
-        data.append((raw - (preamble[9] + preamble[8])) * preamble[7])
+    if data:
+        # Add the time channel to the output
+        data.insert(0, (np.arange(len(data[0])) - (t_preamble[6] + t_preamble[5])) * t_preamble[4])
 
     inst.write(":RUN")
     inst.close()
@@ -181,6 +418,8 @@ SI_PREFIX = {
     +6: "M", +9: "G", +12: "T", +15: "P", +18: "E"
 }
 
+SI_DIV = {power: 10.0**power for power in SI_PREFIX}
+
 SUPERSCRIPT = {
     '0': '\u2070', '1': '\u00B9', '2': '\u00B2', '3': '\u00B3', '4': '\u2074',
     '5': '\u2075', '6': '\u2076', '7': '\u2077', '8': '\u2078', '9': '\u2079',
@@ -189,23 +428,36 @@ SUPERSCRIPT = {
     '.': '\u22C5' #This is a controversial choice -- there is no good one!
 }
 
+SUPERSCRIPT_TRANS = str.maketrans(SUPERSCRIPT)
+
 def superscript(s):
-    return ''.join(SUPERSCRIPT.get(c, c) for c in s)
+    return s.translate(SUPERSCRIPT_TRANS)
+
+def round_sf(x, sig_figs):
+    # Round to the requested number of significant figures; this is done
+    #   before choosing the decimals or prefix, as it may carry into the next
+    #   decade (e.g. 9.9996 -> 10.00)
+    return float(f'{x:.{max(sig_figs - 1, 0)}e}')
 
 def sf_format(x, sig_figs):
-    return f'{x:f}'[:sig_figs+1].rstrip('.')
+    # Never drops digits before the decimal point
+    x = round_sf(x, sig_figs)
+    digits = math.floor(math.log10(abs(x))) + 1 if x else 1
+    return f'{x:.{max(sig_figs - digits, 0)}f}'
 
 def scientific_format(x, sig_figs=4):
-    power = int(np.floor(np.log10(abs(x))))
+    x = round_sf(x, sig_figs)
+    power = math.floor(math.log10(abs(x)))
     num = sf_format(x / 10**power, sig_figs)
     if power:
         num += f' × 10{superscript(str(power))}'
     return num
 
 def get_prefix(x):
-    power = int(np.floor(np.log10(abs(x))//3))*3
+    # Scalar math functions are much faster than numpy for single values
+    power = 3 * (math.floor(math.log10(abs(x))) // 3)
     if power in SI_PREFIX:
-        return SI_PREFIX[power], 10**power
+        return SI_PREFIX[power], SI_DIV[power]
     else:
         return None, 1
 
@@ -213,6 +465,7 @@ def SI_format(x, units='', sig_figs=4):
     if x == 0:
         return "0"
     else:
+        x = round_sf(x, sig_figs)
         prefix, div = get_prefix(x)
         if prefix is not None:
             num = sf_format(x / div, sig_figs) + f' {prefix}'
@@ -243,36 +496,68 @@ def save_csv(fn, data, fit=[], harmonics=None):
             headings.append(headings[-1] + ' fit')
             cols.append(fit[i-1])
 
+    table = []
     if harmonics:
+        harmonics = Harmonics.from_dict(harmonics)
         headings += ["", "Harmonic", "Frequency (Hz)", "Amplitude (V)", "Phase Delay (rad)"]
-        cols += [[], [], [], [], []]
-        for n in range(1, harmonics['num harmonics'] + 1):
-            cols[-4].append(n)
-            cols[-3].append(harmonics[f'ω{n}'] / (2*π))
-            cols[-2].append(harmonics[f'A{n}'])
-            cols[-1].append(harmonics[f'ϕ{n}'])
-
-        cols[-4].append('ref')
-        cols[-3].append(harmonics[f'ref ω'] / (2*π))
-        cols[-2].append(harmonics[f'ref A'])
-        cols[-1].append(harmonics[f'ref ϕ'])
+        # Harmonics first, then the reference (index 0 of the arrays)
+        order = np.roll(np.arange(harmonics.num_harmonics + 1), -1)
+        table = [
+            list(range(1, harmonics.num_harmonics + 1)) + ['ref'],
+            list(harmonics.omega[order] / (2*π)),
+            list(harmonics.A[order]),
+            list(harmonics.phi[order]),
+        ]
 
     # 169.236.119.238
 
+    block = np.column_stack(cols)
+    # Enough digits for every value to read back exactly
+    fmt = ['%.9g' if np.asarray(col).dtype == np.float32 else '%.17g' for col in cols]
+    n_table = len(table[0]) if table else 0
+
     with open(fn, 'wt') as f:
         f.write(','.join(headings) + '\n')
 
-        for i in range(max(map(len, cols))):
-            items = []
-            lnz = 0
-            for j, col in enumerate(cols):
-                if i < len(col):
-                    items.append(str(col[i]))
-                    lnz = j
-                else:
-                    items.append("")
+        # The first rows are shared with the harmonics table, and are written
+        #   one at a time; the remaining data is written in bulk.
+        for i in range(n_table):
+            if i < len(block):
+                items = [fm % x for fm, x in zip(fmt, block[i])]
+            else:
+                items = [""] * len(fmt)
+            items += [""] + [str(col[i]) for col in table]
+            f.write(','.join(items) + '\n')
+
+        np.savetxt(f, block[n_table:], fmt=fmt, delimiter=',')
 
-            f.write(','.join(items[:lnz+1]) + '\n')
+def fit_data(data, harmonics=5):
+    '''Fit the reference and signal channels of a data set.
+
+    Parameters
+    ----------
+    data : (t, V_ref, V_sig) arrays
+    harmonics : number of harmonics to extract from the signal (default: 5)
+
+    Returns
+    -------
+    result : dictionary of the Harmonics (from find_harmonics), the fitted
+             curves and the signal offset.
+    '''
+    t, ref, sig = data
+    d = find_harmonics(t, ref, sig, harmonics)
+
+    ref_fit = cosine_fit(t, d.ref_offset, d.ref_A, d.omega[0], d.phi[0])
+    sig_fit = harmonic_reconstruct(t, d)
+
+    return {
+        'harmonics': d,
+        'ref_fit': ref_fit,
+        # Reference fit rescaled to the range [0, 1]
+        'ref_fit1': 0.5 + (ref_fit - d.ref_offset) / (2 * d.ref_A),
+        'sig_fit': sig_fit,
+        'sig_offset': (sig - sig_fit).mean(),
+    }
 
 class Tabs(QtWidgets.QTabWidget):
     def __init__(self, parent):
@@ -281,9 +566,11 @@ class Tabs(QtWidgets.QTabWidget):
         self.setTabsClosable(True)
         self.tabCloseRequested.connect(self.remove_tab)
 
-    def add_tab(self, widget, title):
+    def add_tab(self, widget, title, select=True):
         self.pages.append(widget)
-        self.setCurrentIndex(self.addTab(self.pages[-1], title))
+        index = self.addTab(self.pages[-1], title)
+        if select:
+            self.setCurrentIndex(index)
 
     def remove_tab(self, index):
         self.removeTab(index)
@@ -292,14 +579,48 @@ class Tabs(QtWidgets.QTabWidget):
     def current_tab(self):
         return self.pages[self.currentIndex()]
 
+class FitSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(dict)
+    failed = QtCore.pyqtSignal(str)
+
+class FitWorker(QtCore.QRunnable):
+    def __init__(self, data, harmonics=5):
+        super().__init__()
+        self.data = data
+        self.harmonics = harmonics
+        self.signals = FitSignals()
+
+    def run(self):
+        try:
+            result = fit_data(self.data, self.harmonics)
+        except Exception as e:
+            self.signals.failed.emit(f'{e.__class__.__name__}: {e}')
+        else:
+            self.signals.done.emit(result)
+
+# numba's parallel kernels can't safely be called from several threads at
+#   once, so fits are run one at a time on their own thread pool
+FIT_POOL = QtCore.QThreadPool()
+FIT_POOL.setMaxThreadCount(1)
+
 class DataDisplay(QtWidgets.QSplitter):
     def __init__(self, parent, data, harmonics=5):
         super().__init__(parent)
         self.setOrientation(QtCore.Qt.Vertical)
         self.layout = QtWidgets.QVBoxLayout(self)
 
+        # matplotlib is slow to import, so wait until a plot is needed
+        import matplotlib
+        matplotlib.use('Qt5Agg')
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+        from matplotlib.figure import Figure
+
         self.fig = Figure()
         self.fig_canvas = FigureCanvasQTAgg(self.fig)
+        self.fig_canvas.mpl_connect('draw_event', self.save_background)
+        self.plot_axes = {}
+        self.plot_backgrounds = {}
+        self.plot_view = None
 
         # self.splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
         self.addWidget(self.fig_canvas)
@@ -315,6 +636,10 @@ class DataDisplay(QtWidgets.QSplitter):
 
         self.data = data
         self.num_harmonics = harmonics
+        self._scaled_t = {}
+        # Time units for each view; the detail view is added once the
+        #   period is known
+        self.t_scales = {'wide': self.time_scale(data[0].max() - data[0].min())}
 
         if len(data) != 3:
             self.layout.addWidget(
@@ -324,8 +649,6 @@ class DataDisplay(QtWidgets.QSplitter):
             self.detail_plot = False
 
         else:
-            self.detail_plot = True
-
             layout = QtWidgets.QHBoxLayout()
 
             self.button_detail = QtWidgets.QRadioButton("Detailed signal view")
@@ -341,58 +664,129 @@ class DataDisplay(QtWidgets.QSplitter):
 
             self.layout.addLayout(layout)
 
-            self.harmonics = find_harmonics(data[0], data[1], data[2], self.num_harmonics)
-
-            self.ref_fit = cosine_fit(data[0], *(self.harmonics[l] for l in ('ref offset', 'ref A', 'ref ω', 'ref ϕ')))
-            self.ref_fit1 = cosine_fit(data[0], 0.5, 0.5, *(self.harmonics[l] for l in ('ref ω', 'ref ϕ')))
-            self.sig_fit = harmonic_reconstruct(data[0], self.harmonics)
-
-            self.table = QtWidgets.QTableWidget(self.num_harmonics+1, 5, self)
-            self.layout.addWidget(self.table)
-            self.table.setHorizontalHeaderLabels(
-                ['Frequency', 'Amplitude', 'Phase Delay', 'Phase Delay (deg)', 'Delay']
-            )
-            self.table.setVerticalHeaderLabels(
-                ['Reference', 'Fundamental'] +
-                [f'Harmonic {n}' for n in range(2, self.num_harmonics+1)]
-            )
+            # Fitting is done in a background thread to keep the GUI
+            #   responsive; results are filled in by populate.
+            self.detail_plot = False
+            self.button_detail.setEnabled(False)
+            self.button_wide.setEnabled(False)
+
+            self.busy = QtWidgets.QProgressBar()
+            self.busy.setRange(0, 0)
+            self.layout.addWidget(self.busy)
+
+        # The fit and plot are done when the tab is first shown, so opening
+        #   several files at once only blocks for the one being looked at
+        self._built = False
+        self.fitting = False
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self._built:
+            self._built = True
+            self._build_analysis()
+
+    def _build_analysis(self):
+        if len(self.data) == 3:
+            if HAS_NUMBA:
+                # Start numba's threads from the GUI thread; if they are first
+                #   started by a fit, the application hangs on exit
+                numba.get_num_threads()
+
+            worker = FitWorker(self.data, self.num_harmonics)
+            worker.signals.done.connect(self.populate)
+            worker.signals.failed.connect(self.fit_failed)
+            self.fit_signals = worker.signals
+            self.fitting = True
+            FIT_POOL.start(worker)
 
-            ω, A, ϕ = [self.harmonics[f'ref {l}'] for l in ("ω", "A", "ϕ")]
-            self.period = 2*π / ω
-            ϕ = (-ϕ) % (2*π)
-
-            # FFT bin size is 1 / Δt -- assume our actual error is 10% of this
-            freq_precision = 0.1 / (self.data[0][-1] - self.data[0][0])
-            # print(freq_precision)
-            freq_sigfigs = int(np.ceil(np.log10(ω / (2*π) / freq_precision)))
-
-            self.table.setItem(0, 0, QtWidgets.QTableWidgetItem(SI_format(ω / (2*π), 'Hz', freq_sigfigs)))
-            self.table.setItem(0, 1, QtWidgets.QTableWidgetItem(SI_format(A, 'V')))
-            self.table.setItem(0, 2, QtWidgets.QTableWidgetItem(f'({ϕ:.3f} rad)'))
-            self.table.setItem(0, 3, QtWidgets.QTableWidgetItem(f'({ϕ * 180/π:.1f}°)'))
-            self.table.setItem(0, 4, QtWidgets.QTableWidgetItem(f'({SI_format(ϕ/ω, "s")})'))
-            self.ref_delay = ϕ/ω
-
-            for n in range(1, self.num_harmonics+1):
-                ω, A, ϕ = [self.harmonics[f'{l}{n}'] for l in ("ω", "A", "ϕ")]
-                ϕ = (-ϕ) % (2*π)
-                if n == 1:
-                    self.fund_delay = ϕ/ω
-                self.table.setItem(n, 0, QtWidgets.QTableWidgetItem(SI_format(ω / (2*π), 'Hz', freq_sigfigs)))
-                self.table.setItem(n, 1, QtWidgets.QTableWidgetItem(SI_format(A, 'V')))
-                self.table.setItem(n, 2, QtWidgets.QTableWidgetItem(f'{ϕ:.3f} rad'))
-                self.table.setItem(n, 3, QtWidgets.QTableWidgetItem(f'{ϕ * 180/π:.1f}°'))
-                item = QtWidgets.QTableWidgetItem(SI_format(ϕ/ω, "s"))
-                self.table.setItem(n, 4, item)
-                if n == 1:
-                    item.setForeground(QtGui.QBrush(QtCore.Qt.red))
-
-            note = QtWidgets.QLabel("Note: reference delay mesaured relative to trigger (t=0); other delays mesaured relative to reference signal peak!")
-            note.setWordWrap(True)
-            self.layout.addWidget(note)
+        self.draw_plot()
 
+    def populate(self, result):
+        self.fitting = False
+        self.busy.deleteLater()
+
+        self.harmonics = result['harmonics']
+        self.ref_fit = result['ref_fit']
+        self.ref_fit1 = result['ref_fit1']
+        self.sig_fit = result['sig_fit']
+        self.sig_offset = result['sig_offset']
+
+        # A view on a model is populated in one go, instead of relaying out
+        #   a QTableWidget for every item
+        self.table = QtWidgets.QTableView(self)
+        self.layout.addWidget(self.table)
+        model = QtGui.QStandardItemModel(self.num_harmonics+1, 5, self.table)
+        model.setHorizontalHeaderLabels(
+            ['Frequency', 'Amplitude', 'Phase Delay', 'Phase Delay (deg)', 'Delay']
+        )
+        model.setVerticalHeaderLabels(
+            ['Reference', 'Fundamental'] +
+            [f'Harmonic {n}' for n in range(2, self.num_harmonics+1)]
+        )
+
+        h = self.harmonics
+        ω, A, ϕ = h.omega[0], h.A[0], h.phi[0]
+        self.period = 2*π / ω
+        ϕ = (-ϕ) % (2*π)
+
+        # FFT bin size is 1 / Δt -- assume our actual error is 10% of this
+        freq_precision = 0.1 / (self.data[0][-1] - self.data[0][0])
+        # print(freq_precision)
+        freq_sigfigs = int(np.ceil(np.log10(ω / (2*π) / freq_precision)))
+
+        rows = [[
+            SI_format(ω / (2*π), 'Hz', freq_sigfigs),
+            SI_format(A, 'V'),
+            f'({ϕ:.3f} rad)',
+            f'({ϕ * 180/π:.1f}°)',
+            f'({SI_format(ϕ/ω, "s")})'
+        ]]
+        self.ref_delay = ϕ/ω
+        self.t_scales['detail'] = self.time_scale(self.period)
+
+        ω, A, ϕ = h.omega[1:], h.A[1:], h.phi[1:]
+        ϕ = (-ϕ) % (2*π)
+        delay = ϕ/ω
+        self.fund_delay = delay[0]
+
+        rows += [[
+            SI_format(ω[i] / (2*π), 'Hz', freq_sigfigs),
+            SI_format(A[i], 'V'),
+            f'{ϕ[i]:.3f} rad',
+            f'{ϕ[i] * 180/π:.1f}°',
+            SI_format(delay[i], "s")
+        ] for i in range(self.num_harmonics)]
+
+        self.table.setUpdatesEnabled(False)
+        model.blockSignals(True)
+        for i, row in enumerate(rows):
+            for j, text in enumerate(row):
+                model.setItem(i, j, QtGui.QStandardItem(text))
+        model.item(1, 4).setForeground(QtGui.QBrush(QtCore.Qt.red))
+        model.blockSignals(False)
+        self.table.setModel(model)
+        self.table.setUpdatesEnabled(True)
+
+        note = QtWidgets.QLabel("Note: reference delay mesaured relative to trigger (t=0); other delays mesaured relative to reference signal peak!")
+        note.setWordWrap(True)
+        self.layout.addWidget(note)
+
+        self.button_detail.setEnabled(True)
+        self.button_wide.setEnabled(True)
+        self.button_detail.setChecked(True)
+        self.detail_plot = True
+        # The wide view may already be built; if so the fit is added to it,
+        #   rather than rebuilding the figure
+        if 'wide' in self.plot_axes:
+            self.plot_wide_fit(self.plot_axes['wide'])
+            self.plot_backgrounds.pop('wide', None)
         self.draw_plot()
 
+    def fit_failed(self, message):
+        self.fitting = False
+        self.busy.deleteLater()
+        self.layout.addWidget(QtWidgets.QLabel(f'Fitting failed! {message}'))
+
     def save_csv(self, fn):
         args = [fn, self.data]
         if hasattr(self, 'harmonics'):
@@ -407,76 +801,104 @@ class DataDisplay(QtWidgets.QSplitter):
         self.detail_plot = False
         self.draw_plot()
 
-    def draw_plot(self):
-        self.fig.clear()
-        # self.axes = self.fig.add_subplot(111)
-        self.axes = self.fig.add_axes([0.15, 0.2, 0.8, 0.75])
+    def time_scale(self, x):
+        prefix, div = get_prefix(x)
+        return ("" if prefix is None else prefix), div
 
-        if getattr(self, 'detail_plot', False):
-            self.t_prefix, self.t_div = get_prefix(self.period)
-            if self.t_prefix is None:
-                self.t_prefix = ""
+    def scaled_time(self, div, offset=0):
+        # (t - offset) / div, cached so that switching views doesn't need to
+        #   recompute it
+        key = (div, offset)
+        if key not in self._scaled_t:
+            self._scaled_t[key] = (self.data[0] - offset) / div
+        return self._scaled_t[key]
 
-            self.axes.set_xlabel(f'time ({self.t_prefix}s)')
-            self.t = self.data[0] / self.t_div
+    def draw_plot(self):
+        view = 'detail' if getattr(self, 'detail_plot', False) else 'wide'
+        self.plot_view = view
+        self.t_prefix, self.t_div = self.t_scales[view]
+        self.t = self.scaled_time(self.t_div, self.ref_delay if view == 'detail' else 0)
 
-            # self.axes.plot(self.t, self.ref_fit)
-            # self.axes.plot(self.t, self.sig_fit)
+        # Each view has its own axes, which are only built the first time
+        #   they are shown; after that switching views toggles visibility.
+        if view not in self.plot_axes:
+            # self.axes = self.fig.add_subplot(111)
+            self.axes = self.fig.add_axes([0.15, 0.2, 0.8, 0.75], label=view)
+            self.plot_axes[view] = self.axes
 
-            self.t_prefix, self.t_div = get_prefix(self.period)
-            if self.t_prefix is None:
-                self.t_prefix = ""
-            self.t = self.data[0] / self.t_div
+            if view == 'detail':
+                # self.axes.plot(self.t, self.ref_fit)
+                # self.axes.plot(self.t, self.sig_fit)
 
-            t1 = self.ref_delay / self.t_div
-            self.t -= t1
-            t2 = self.fund_delay / self.t_div
+                t2 = self.fund_delay / self.t_div
 
-            t0 = -2.5*self.period / self.t_div
+                t0 = -2.5*self.period / self.t_div
 
 
-            if t0 < self.t[0]:
-                t0 = self.t[0]
+                if t0 < self.t[0]:
+                    t0 = self.t[0]
 
+                t3 = t0 + 5*self.period/self.t_div
 
+                # Only the visible part of the data needs to be plotted
+                i0, i1 = np.searchsorted(self.t, [t0, t3])
+                vis = slice(max(i0 - 1, 0), i1 + 1)
+                t = self.t[vis]
 
-            # self.axes.plot(self.t, self.data[1], '.')
 
-            self.axes.plot(self.t, self.data[2], '.', color='C1')
-            # self.axes.plot(self.t, self.ref_fit)
-            self.axes.plot(self.t, self.sig_fit, 'k--')
 
-            yl = self.axes.get_ylim()
-            self.axes.plot([0, 0], yl, 'k:', zorder=-1)
-            self.axes.plot([t2, t2], yl, 'r-', zorder=-1)
-            self.axes.plot(self.t, (self.ref_fit1 * (yl[1] - yl[0])) + yl[0], color='C0', alpha=0.5, zorder=-1)
+                # self.axes.plot(self.t, self.data[1], '.')
 
+                self.axes.plot(*minmax_decimate(t, self.data[2][vis]), '.', color='C1')
+                # self.axes.plot(self.t, self.ref_fit)
+                self.axes.plot(*minmax_decimate(t, self.sig_fit[vis]), 'k--')
 
-            self.axes.set_ylim(*yl)
-            self.axes.set_xlim(t0, t0 + 5*self.period/self.t_div)
-            self.axes.set_xlabel(f'delay time, relative to reference ({self.t_prefix}s)')
-            self.axes.set_ylabel(f'voltage (V)')
+                yl = self.axes.get_ylim()
+                self.axes.plot([0, 0], yl, 'k:', zorder=-1)
+                self.axes.plot([t2, t2], yl, 'r-', zorder=-1)
+                self.axes.plot(*minmax_decimate(t, (self.ref_fit1[vis] * (yl[1] - yl[0])) + yl[0]), color='C0', alpha=0.5, zorder=-1)
 
-        else:
-            self.t_prefix, self.t_div = get_prefix(self.data[0].max() - self.data[0].min())
-            if self.t_prefix is None:
-                self.t_prefix = ""
 
-            self.axes.set_xlabel(f'time ({self.t_prefix}s)')
-            self.t = self.data[0] / self.t_div
-            self.axes.set_ylabel(f'voltage (V)')
+                self.axes.set_ylim(*yl)
+                self.axes.set_xlim(t0, t3)
+                self.axes.set_xlabel(f'delay time, relative to reference ({self.t_prefix}s)')
+                self.axes.set_ylabel(f'voltage (V)')
 
-            for i in range(1, len(self.data)):
-                label = {1: "reference", 2:"signal"}.get(i, None)
-                self.axes.plot(self.t, self.data[i], '.', label=label)
-
-            if hasattr(self, 'ref_fit'):
-                self.axes.plot(self.t, self.ref_fit, 'k-', 'fit')
-                self.axes.plot(self.t, self.sig_fit, 'k-')
+            else:
+                self.axes.set_xlabel(f'time ({self.t_prefix}s)')
+                self.axes.set_ylabel(f'voltage (V)')
+
+                for i in range(1, len(self.data)):
+                    label = {1: "reference", 2:"signal"}.get(i, None)
+                    self.axes.plot(*minmax_decimate(self.t, self.data[i]), '.', label=label)
+
+                if hasattr(self, 'ref_fit'):
+                    self.plot_wide_fit(self.axes)
+
+        self.axes = self.plot_axes[view]
+        for v, axes in self.plot_axes.items():
+            axes.set_visible(v == view)
+
+        # If this view was already rendered at the current size, blit the
+        #   saved image rather than redrawing the whole figure
+        size, background = self.plot_backgrounds.get(view, (None, None))
+        if size == self.fig_canvas.get_width_height():
+            self.fig_canvas.restore_region(background)
+            self.fig_canvas.blit(self.fig.bbox)
+        else:
+            self.fig_canvas.draw_idle()
 
-                self.axes.legend()
+    def plot_wide_fit(self, axes):
+        t = self.scaled_time(self.t_scales['wide'][1])
+        axes.plot(*minmax_decimate(t, self.ref_fit), 'k-', label='fit')
+        axes.plot(*minmax_decimate(t, self.sig_fit), 'k-')
+        axes.legend()
 
-        self.fig_canvas.draw()
+    def save_background(self, event):
+        self.plot_backgrounds[self.plot_view] = (
+            self.fig_canvas.get_width_height(),
+            self.fig_canvas.copy_from_bbox(self.fig.bbox)
+        )
 
 
 def error_popup(e, ok=False):
@@ -484,7 +906,7 @@ def error_popup(e, ok=False):
     if isinstance(e, str):
         title = "error"
         text = e
-        detail = none
+        detail = None
     else:
         ec = e.__class__.__name__
         title = str(ec)
@@ -582,21 +1004,27 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     def open_file(self):
-        fn, ext = QtWidgets.QFileDialog.getOpenFileName(self, 'Open Data',
+        fns, ext = QtWidgets.QFileDialog.getOpenFileNames(self, 'Open Data',
             os.getcwd(), "CSV (*.csv)")
-        if fn:
-            self.load_file(fn)
+        # Only the first file is brought to the front; the rest are opened in
+        #   background tabs, which aren't fitted until they are selected
+        for i, fn in enumerate(fns):
+            self.load_file(fn, select=(i == 0))
 
-    def load_file(self, fn):
+    def load_file(self, fn, select=True):
         try:
             data = load_osc_csv(fn)
         except Exception as e:
             error_popup(e)
         else:
             display = DataDisplay(self, data)
-            self.tabs.add_tab(display, os.path.split(fn)[1])
+            self.tabs.add_tab(display, os.path.split(fn)[1], select)
 
     def save_file(self):
+        if self.tabs.current_tab().fitting:
+            error_popup("Fit still running; wait for it to finish before saving.")
+            return
+
         fn, ext = QtWidgets.QFileDialog.getSaveFileName(self, 'Save CSV Data',
             os.getcwd(), "CSV (*.csv)")
         if fn:
@@ -18,7 +18,28 @@
 import numpy as np
 π = np.pi
 import os, sys
-from scipy import optimize
+import cmath, math
+import functools
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+# pandas is only used to load CSV files, and is slow to import, so just
+#   check that it exists here
+HAS_PANDAS = importlib.util.find_spec('pandas') is not None
+
+try:
+    import numexpr
+except ImportError:
+    HAS_NUMEXPR = False
+else:
+    HAS_NUMEXPR = True
+
+try:
+    import numba
+except ImportError:
+    HAS_NUMBA = False
+else:
+    HAS_NUMBA = True
 
 try:
     import vxi11
@@ -30,23 +51,160 @@ else:
     from .oscope import get_oscope
 
 
+if HAS_NUMBA:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _harmonic_sums(t, sig, ω0, ϕ0, harmonics, blocks):
+        # Σ sig exp(-i n (ω0 t + ϕ0)) for n = 1...harmonics; the samples are
+        #   split into blocks which are summed in parallel, and the higher
+        #   harmonics are generated by repeated multiplication.
+        N = len(t)
+        partial = np.zeros((blocks, harmonics), dtype=np.complex128)
+
+        for b in numba.prange(blocks):
+            for k in range(b*N//blocks, (b+1)*N//blocks):
+                z = cmath.exp(-1j * (ω0*t[k] + ϕ0))
+                zn = sig[k] * z
+                for n in range(harmonics):
+                    partial[b, n] += zn
+                    zn *= z
+
+        return partial.sum(axis=0)
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _harmonic_reconstruct(t, c, ω0, ϕ0):
+        # Re[Σ c[n-1] z^n], z = exp(i (ω0 t + ϕ0)), using Horner's rule
+        x = np.empty(len(t))
+
+        for k in numba.prange(len(t)):
+            z = cmath.exp(1j * (ω0*t[k] + ϕ0))
+            y = 0j
+            for n in range(len(c)-1, -1, -1):
+                y = (y + c[n]) * z
+            x[k] = y.real
+
+        return x
+
+
 def cosine_fit(t, x0, A, ω, ϕ):
+    if HAS_NUMEXPR and isinstance(t, np.ndarray):
+        # Single pass over t, with no temporary arrays
+        return numexpr.evaluate('x0 + A * cos(w * t + p)',
+            local_dict={'t': t, 'x0': x0, 'A': A, 'w': ω, 'p': ϕ})
+
     return x0 + A * np.cos(ω * t + ϕ)
 
+def cosine_fit_jac(t, x0, A, ω, ϕ):
+    # Analytic Jacobian of cosine_fit w.r.t. (x0, A, ω, ϕ)
+    θ = ω * t + ϕ
+    c, s = np.cos(θ), np.sin(θ)
+    return np.stack([np.ones_like(t), c, -A * t * s, -A * s], axis=1)
+
+@functools.lru_cache(maxsize=8)
+def _get_window(N, window=np.hanning):
+    '''Return a window normalized so that it sums to 2, for use in
+    find_harmonics.  Results are cached, so the returned array is read-only.
+
+    Parameters
+    ----------
+    N : number of points
+    window : either a function which returns a window of length N (e.g.
+        np.hanning), or a name accepted by scipy.signal.get_window
+    '''
+    if isinstance(window, str):
+        from scipy.signal import get_window
+        w = get_window(window, N, fftbins=False)
+    else:
+        w = window(N)
+    w = w * (2 / w.sum())
+    w.flags.writeable = False
+    return w
+
+class Harmonics(dict):
+    '''Harmonics of a signal, as returned by find_harmonics.
+
+    The fit is stored as parallel arrays, where index 0 is the reference
+    signal and index n is harmonic n.  For compatibility, this is also a
+    dictionary with the keys 'num harmonics', 'ref offset', 'ref A',
+    'ref ω', 'ref ϕ', 'ref error', 'ω{n}', 'A~{n}', 'A{n}' and 'ϕ{n}'; these
+    are a snapshot of the arrays, and are not updated if the arrays change.
+
+    The reference fit is normalized so that its amplitude is positive; if
+    ref_A < 0, it is negated and π is added to ref_ϕ.  The harmonic phases
+    are measured relative to ref_ϕ, so they are corrected to match.
+
+    Attributes
+    ----------
+    num_harmonics : number of harmonics of the signal
+    omega : angular frequencies
+    A : amplitudes
+    phi : phases
+    A_complex : complex amplitudes, A * exp(i phi)
+    ref_offset, ref_A, ref_error : offset, amplitude and RMS error of the
+        cosine fit to the reference signal
+    '''
+    def __init__(self, ref_offset, ref_A, ref_ω, ref_ϕ, ref_error, A_n):
+        self.num_harmonics = len(A_n)
+
+        if ref_A < 0:
+            # Shifting ref_ϕ by π changes the phase of harmonic n by nπ
+            ref_A = -ref_A
+            ref_ϕ = (ref_ϕ + π) % (2*π)
+            A_n = A_n * (-1)**np.arange(1, self.num_harmonics + 1)
+
+        self.ref_offset = ref_offset
+        self.ref_A = ref_A
+        self.ref_error = ref_error
+
+        self.A_complex = np.empty(self.num_harmonics + 1, dtype='c16')
+        self.A_complex[0] = ref_A * np.exp(1j * ref_ϕ)
+        self.A_complex[1:] = A_n
+
+        self.omega = np.arange(self.num_harmonics + 1) * ref_ω
+        self.omega[0] = ref_ω
+        self.A = np.abs(self.A_complex)
+        self.phi = np.angle(self.A_complex)
+        self.phi[0] = ref_ϕ
+
+        super().__init__({
+            'num harmonics': self.num_harmonics,
+            'ref offset': ref_offset,
+            'ref A': ref_A,
+            'ref ω': ref_ω,
+            'ref ϕ': ref_ϕ,
+            'ref error': ref_error,
+        })
+
+        for n in range(1, self.num_harmonics + 1):
+            self[f'ω{n}'] = self.omega[n]
+            self[f'A~{n}'] = self.A_complex[n]
+            self[f'A{n}'] = self.A[n]
+            self[f'ϕ{n}'] = self.phi[n]
+
+    @classmethod
+    def from_dict(cls, d):
+        '''Convert a dictionary with the keys of find_harmonics (e.g. from an
+        older version of this module) to a Harmonics object.  Harmonics
+        objects are returned unchanged.'''
+        if isinstance(d, cls):
+            return d
+        A_n = np.array([d[f'A~{n}'] for n in range(1, d['num harmonics'] + 1)])
+        return cls(d['ref offset'], d['ref A'], d['ref ω'], d['ref ϕ'],
+            d['ref error'], A_n)
+
 def find_harmonics(t, ref, signal, harmonics=5, window=np.hanning):
-    d = {"num harmonics":harmonics}
+    # scipy is slow to import, so only load it when it's needed
+    from scipy import optimize, fft
 
     dt = t[1] - t[0]
     N = len(t)
 
     offset = ref.mean()
-    window = window(N)
-    window *= 2 / window.sum()
+    window = _get_window(N, window)
     ref_w = (ref - offset) * window
 
     # FFT of reference
-    ref_f = np.fft.rfft(ref_w)[:N//2]
-    f = np.fft.fftfreq(N, dt)[:N//2]
+    ref_f = fft.rfft(ref_w, workers=-1)
+    f = fft.rfftfreq(N, dt)
 
     # Find strongest frequency, including amplitude and phase
     i = np.argmax(abs(ref_f))
@@ -56,42 +214,92 @@ def find_harmonics(t, ref, signal, harmonics=5, window=np.hanning):
     p0 = (offset, abs(A), ωg, np.angle(A) - ωg * t[0])
 
     # Fit reference signal
-    popt, pconv = optimize.curve_fit(cosine_fit, t, ref, p0)
+    popt, pconv = optimize.curve_fit(cosine_fit, t, ref, p0, jac=cosine_fit_jac, method='lm')
 
-    # Update data
-    d['ref offset'], d['ref A'], d['ref ω'], d['ref ϕ'] = popt
-    d['ref ϕ'] = d['ref ϕ'] % (2*π)
-    d['ref error'] = (ref - cosine_fit(t, *popt)).std()
-
-    ω0, ϕ0 = d['ref ω'], d['ref ϕ']
+    ref_offset, ref_A, ω0, ϕ0 = popt
+    ϕ0 = ϕ0 % (2*π)
+    ref_error = (ref - cosine_fit(t, *popt)).std()
 
     # Windowed signal for analysis
     sig = (signal - signal.mean()) * window
 
-    # Compute harmonics
-    for n in range(1, harmonics + 1):
-        ω = n * ω0
-        d[f'ω{n}'] = ω
-        A = (sig * np.exp(-1j * (ω*t + n*ϕ0))).sum()
-        d[f'A~{n}'] = A
-        d[f'A{n}'] = abs(A)
-        d[f'ϕ{n}'] = np.angle(A)
+    # Compute harmonics as a single matrix-vector product: row n-1 of E is
+    #   exp(-i n (ω0 t + ϕ0)), built by repeated multiplication of the first
+    #   row so only one complex exponential is evaluated per sample.
+    if HAS_NUMBA:
+        A_n = _harmonic_sums(t, sig, ω0, ϕ0, harmonics, numba.get_num_threads())
+    elif harmonics:
+        E = np.empty((harmonics, N), dtype='c16')
+        E[0] = np.exp(-1j * (ω0*t + ϕ0))
+        for n in range(1, harmonics):
+            np.multiply(E[n-1], E[0], out=E[n])
+        # sig is real, so contract it against the (re, im) pairs of E
+        #   directly instead of promoting it to a complex array
+        A_n = (sig @ E.view('f8').reshape(harmonics, N, 2)).view('c16')[:, 0]
+    else:
+        A_n = np.zeros(0, dtype='c16')
+
+    return Harmonics(ref_offset, ref_A, ω0, ϕ0, ref_error, A_n)
 
-    return d
+def harmonic_reconstruct(t, h):
+    h = Harmonics.from_dict(h)
 
-def harmonic_reconstruct(t, d):
+    # Σ A_n cos(n (ω0 t + ϕ0) + ϕ_n) = Re[Σ A_n exp(i ϕ_n) z^n], with
+    #   z = exp(i (ω0 t + ϕ0)); evaluated with Horner's rule so that the
+    #   only transcendental call is the single exponential for z.
+    c = h.A_complex[1:]
+
+    if HAS_NUMBA and isinstance(t, np.ndarray) and t.ndim == 1:
+        return _harmonic_reconstruct(t, c, h.omega[0], h.phi[0])
+
+    if HAS_NUMEXPR and h.num_harmonics:
+        # Build an expression with one term per harmonic, which numexpr
+        #   evaluates in a single pass
+        ld = {'t': t, 'w': h.omega[0]}
+        terms = []
+        for n in range(1, h.num_harmonics + 1):
+            ld[f'A{n}'] = h.A[n]
+            ld[f'p{n}'] = h.phi[n] + n*h.phi[0]
+            terms.append(f'A{n} * cos({n} * w * t + p{n})')
+        return numexpr.evaluate(' + '.join(terms), local_dict=ld)
+
+    z = np.exp(1j * (h.omega[0]*t + h.phi[0]))
     x = 0
-    ϕ0 = d['ref ϕ']
-    for n in range(1, d['num harmonics'] + 1):
-        ω, A, ϕ = d[f'ω{n}'], d[f'A{n}'], d[f'ϕ{n}']
-        x += A * np.cos(ω*t + ϕ + n*ϕ0)
-        if n == 1:
-            label = 'fundamental'
-        else:
-            label = f'harmonic {n}'
-        # print(f'{label:>20s}: A={A:.3f}, ϕ={-ϕ*180/π:.1f}°')
+    for cn in c[::-1]:
+        x = (x + cn) * z
+
+    return np.real(x)
+
+def minmax_decimate(x, y, blocks=2000):
+    '''Reduce the number of points in a curve for plotting, keeping the
+    minimum and maximum of each block so the envelope is preserved.
+
+    Parameters
+    ----------
+    x, y : data arrays
+    blocks : approximate number of blocks to divide the data into (default:
+        2000).  If this would not reduce the number of points, the input is
+        returned unchanged.
+
+    Returns
+    -------
+    x, y : decimated arrays, with two points per block
+    '''
+    N = len(y)
+    r = N // blocks
+    if r <= 2:
+        return x, y
+
+    nb = N // r
+    n = r * nb
+    yb = y[:n].reshape(nb, r)
+    i = np.sort(np.stack([yb.argmin(1), yb.argmax(1)], axis=1), axis=1)
+    i = (i + r * np.arange(nb)[:, np.newaxis]).ravel()
 
-    return x
+    if n < N:
+        i = np.concatenate([i, n + np.unique([y[n:].argmin(), y[n:].argmax()])])
+
+    return x[i], y[i]
 
 def load_osc_csv(fn, offset=True):
     '''Load data from the CSV's generated by the Rigol DS1054.
@@ -113,7 +321,13 @@ def load_osc_csv(fn, offset=True):
     with open(fn) as f:
         f.readline() #The first line is headers, just skip
         parts = f.readline().split(',') #The second line includes the time increment data
-        data = np.loadtxt(f, delimiter=',', usecols=np.arange(len(parts)-2), unpack=True)
+        cols = np.arange(len(parts)-2)
+        if HAS_PANDAS:
+            # Pandas C parser is much faster than loadtxt for long captures
+            import pandas
+            data = pandas.read_csv(f, header=None, usecols=cols, dtype=np.float64).to_numpy().T
+        else:
+            data = np.loadtxt(f, delimiter=',', usecols=cols, unpack=True)
 
     start = float(parts[-2]) #Second to last entry is the time start
     inc = float(parts[-1]) #Last entry is the time increment
@@ -130,6 +344,32 @@ def idn_eth(ip):
     inst.close()
     return reply
 
+def convert_rigol_raw(raw, preamble):
+    '''Convert the reply to a Rigol ":WAV:DATA?" query (in BYTE format) to
+    voltages.
+
+    Parameters
+    ----------
+    raw : bytes returned by the oscilloscope
+    preamble : list of values returned by ":WAV:PRE?" for the same channel
+
+    Returns
+    -------
+    V : float32 array of voltages
+    '''
+    if raw[0:1] != b'#':
+        raise ValueError(f'First byte of raw data should be #, found {chr(raw[0])}')
+    N_head = int(raw[1:2])
+    N_points = int(raw[2:2+N_head])
+
+    # View the payload in place, rather than copying it out with a slice
+    raw = np.frombuffer(raw, dtype='u1', count=N_points, offset=2+N_head)
+
+    # 8 bit samples only have 256 possible values, so convert them with a
+    #   lookup table rather than doing the arithmetic for every point
+    lut = (np.arange(256, dtype='f4') - (preamble[9] + preamble[8])) * preamble[7]
+    return lut[raw]
+
 def load_eth(ip, channels=(1, 2)):
     if not HAS_VXI11:
         raise RuntimeError("VXI11 not installed; can't load data over ethernet!\n(to install, run: pip install python-vxi11)")
@@ -138,29 +378,31 @@ def load_eth(ip, channels=(1, 2)):
     inst.timeout = 3
 
     inst.write(":STOP")
+    # The waveform format persists across source changes, so only set it once
+    inst.write(":WAV:FORM BYTE")
 
-    data = []
-
-    for channel in channels:
-        inst.write(f":WAV:SOUR CHAN{channel:d}")
-        inst.write(":WAV:FORM BYTE")
-        inst.write(":WAV:DATA?")
-
-        raw = inst.read_raw()
-        if raw[0:1] != b'#':
-            raise ValueError(f'First byte of raw data should be #, found {chr(dat[0])}')
-        N_head = int(raw[1:2])
-        N_points = int(raw[2:2+N_head])
+    # Each channel is converted in a worker thread, which overlaps with
+    #   reading the next channel from the scope
+    futures = []
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        for channel in channels:
+            inst.write(f":WAV:SOUR CHAN{channel:d}")
+            inst.write(":WAV:DATA?")
+            raw = inst.read_raw()
 
-        raw = np.frombuffer(raw[2+N_head:2+N_head+N_points], dtype='u1')
+            # The time axis is shared, but the vertical scale (preamble[7:10])
+            #   depends on the channel, so the preamble is read for each source
+            preamble = list(map(float, inst.ask(':WAV:PRE?').split(',')))
+            if not futures:
+                t_preamble = preamble
 
-        preamble = list(map(float, inst.ask(':WAV:PRE?').split(',')))
+            futures.append(pool.submit(convert_rigol_raw, raw, preamble))
 
-        if not data:
-            # If we haven't already, write a time channel to the output
-            data.append((np.arange(len(raw)) - (preamble[6] + preamble[5])) * preamble[4])
+        data = [future.result() for future in futures]
 
-        data.append((raw - (preamble[9] + preamble[8])) * preamble[7])
+    if data:
+        # Add the time channel to the output
+        data.insert(0, (np.arange(len(data[0])) - (t_preamble[6] + t_preamble[5])) * t_preamble[4])
 
     inst.write(":RUN")
     inst.close()
@@ -173,6 +415,8 @@ SI_PREFIX = {
     +6: "M", +9: "G", +12: "T", +15: "P", +18: "E"
 }
 
+SI_DIV = {power: 10.0**power for power in SI_PREFIX}
+
 SUPERSCRIPT = {
     '0': '\u2070', '1': '\u00B9', '2': '\u00B2', '3': '\u00B3', '4': '\u2074',
     '5': '\u2075', '6': '\u2076', '7': '\u2077', '8': '\u2078', '9': '\u2079',
@@ -181,23 +425,36 @@ SUPERSCRIPT = {
     '.': '\u22C5' #This is a controversial choice -- there is no good one!
 }
 
+SUPERSCRIPT_TRANS = str.maketrans(SUPERSCRIPT)
+
 def superscript(s):
-    return ''.join(SUPERSCRIPT.get(c, c) for c in s)
+    return s.translate(SUPERSCRIPT_TRANS)
+
+def round_sf(x, sig_figs):
+    # Round to the requested number of significant figures; this is done
+    #   before choosing the decimals or prefix, as it may carry into the next
+    #   decade (e.g. 9.9996 -> 10.00)
+    return float(f'{x:.{max(sig_figs - 1, 0)}e}')
 
 def sf_format(x, sig_figs):
-    return f'{x:f}'[:sig_figs+1].rstrip('.')
+    # Never drops digits before the decimal point
+    x = round_sf(x, sig_figs)
+    digits = math.floor(math.log10(abs(x))) + 1 if x else 1
+    return f'{x:.{max(sig_figs - digits, 0)}f}'
 
 def scientific_format(x, sig_figs=4):
-    power = int(np.floor(np.log10(abs(x))))
+    x = round_sf(x, sig_figs)
+    power = math.floor(math.log10(abs(x)))
     num = sf_format(x / 10**power, sig_figs)
     if power:
         num += f' × 10{superscript(str(power))}'
     return num
 
 def get_prefix(x):
-    power = int(np.floor(np.log10(abs(x))//3))*3
+    # Scalar math functions are much faster than numpy for single values
+    power = 3 * (math.floor(math.log10(abs(x))) // 3)
     if power in SI_PREFIX:
-        return SI_PREFIX[power], 10**power
+        return SI_PREFIX[power], SI_DIV[power]
     else:
         return None, 1
 
@@ -205,6 +462,7 @@ def SI_format(x, units='', sig_figs=4):
     if x == 0:
         return "0"
     else:
+        x = round_sf(x, sig_figs)
         prefix, div = get_prefix(x)
         if prefix is not None:
             num = sf_format(x / div, sig_figs) + f' {prefix}'
@@ -235,31 +493,35 @@ def save_csv(fn, data, fit=[], harmonics=None):
             headings.append(headings[-1] + ' fit')
             cols.append(fit[i-1])
 
+    table = []
     if harmonics:
+        harmonics = Harmonics.from_dict(harmonics)
         headings += ["", "Harmonic", "Frequency (Hz)", "Amplitude (V)", "Phase Delay (rad)"]
-        cols += [[], [], [], [], []]
-        for n in range(1, harmonics['num harmonics'] + 1):
-            cols[-4].append(n)
-            cols[-3].append(harmonics[f'ω{n}'] / (2*π))
-            cols[-2].append(harmonics[f'A{n}'])
-            cols[-1].append(harmonics[f'ϕ{n}'])
-
-        cols[-4].append('ref')
-        cols[-3].append(harmonics[f'ref ω'] / (2*π))
-        cols[-2].append(harmonics[f'ref A'])
-        cols[-1].append(harmonics[f'ref ϕ'])
+        # Harmonics first, then the reference (index 0 of the arrays)
+        order = np.roll(np.arange(harmonics.num_harmonics + 1), -1)
+        table = [
+            list(range(1, harmonics.num_harmonics + 1)) + ['ref'],
+            list(harmonics.omega[order] / (2*π)),
+            list(harmonics.A[order]),
+            list(harmonics.phi[order]),
+        ]
+
+    block = np.column_stack(cols)
+    # Enough digits for every value to read back exactly
+    fmt = ['%.9g' if np.asarray(col).dtype == np.float32 else '%.17g' for col in cols]
+    n_table = len(table[0]) if table else 0
 
     with open(fn, 'wt') as f:
         f.write(','.join(headings) + '\n')
 
-        for i in range(max(map(len, cols))):
-            items = []
-            lnz = 0
-            for j, col in enumerate(cols):
-                if i < len(col):
-                    items.append(str(col[i]))
-                    lnz = j
-                else:
-                    items.append("")
-
-            f.write(','.join(items[:lnz+1]) + '\n')
+        # The first rows are shared with the harmonics table, and are written
+        #   one at a time; the remaining data is written in bulk.
+        for i in range(n_table):
+            if i < len(block):
+                items = [fm % x for fm, x in zip(fmt, block[i])]
+            else:
+                items = [""] * len(fmt)
+            items += [""] + [str(col[i]) for col in table]
+            f.write(','.join(items) + '\n')
+
+        np.savetxt(f, block[n_table:], fmt=fmt, delimiter=',')
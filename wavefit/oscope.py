@@ -18,14 +18,43 @@
 import vxi11
 import re
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-def convert_raw(raw, dtype='u1'):
-    if raw[0:1] != b'#':
-        raise ValueError(f'First byte of raw data should be #, found {chr(dat[0])}')
-    N_head = int(raw[1:2])
-    N_points = int(raw[2:2+N_head])
+_IDN_RE = re.compile(r'TEKTRONIX,TBS(2\d\d2)B')
+
+# Longest record of the TBS2000B series; the scope clips DATA:STOP to the
+#   current record length
+MAX_RECORD_LENGTH = 20_000_000
 
-    return np.frombuffer(raw[2+N_head:2+N_head+N_points], dtype=dtype)
+def convert_raw(raw, dtype='u1'):
+    # Indexing bytes gives an int, so the header checks don't allocate
+    if raw[0] != 0x23: # '#'
+        raise ValueError(f'First byte of raw data should be #, found {chr(raw[0])}')
+    N_head = raw[1] - 0x30
+    N_bytes = int(raw[2:2+N_head])
+
+    # View the payload in place, rather than copying it out with a slice
+    dtype = np.dtype(dtype)
+    return np.frombuffer(raw, dtype=dtype, count=N_bytes // dtype.itemsize, offset=2+N_head)
+
+def scale_raw(raw, V_inc, V_off, out=None):
+    '''Convert raw digitizer levels to voltages: (raw - V_off) * V_inc.
+
+    Parameters
+    ----------
+    raw : integer array returned by convert_raw
+    V_inc, V_off : vertical scale and offset from the waveform preamble
+    out : optional float32 array to write the output to
+
+    Returns
+    -------
+    V : float32 array of voltages
+    '''
+    # Done as a single multiply pass and an in place subtraction, with no
+    #   float64 temporaries
+    out = np.multiply(raw, np.float32(V_inc), out=out, dtype='f4')
+    out -= np.float32(V_off * V_inc)
+    return out
 
 
 class TBS2000B:
@@ -33,7 +62,14 @@ class TBS2000B:
         self.inst = inst
 
         self.error_byte(False) # Clear error bits
-        inst.write('WFMO:ENC BIN')
+        # The data format and range are fixed here, so they don't need to be
+        #   reset or read back from the scope for each curve.  The range
+        #   covers the whole record, even if the record length changes later
+        inst.write('DATA:START 1')
+        inst.write(f'DATA:STOP {MAX_RECORD_LENGTH:d}')
+        inst.write('DATA:WIDTH 1')
+        inst.write('DATA:ENC RPB')
+        self._dtype = 'u1'
         self.error_byte()
 
     def error_byte(self, raise_err=True):
@@ -51,28 +87,39 @@ class TBS2000B:
     def stop(self):
         self.inst.write('ACQ:STATE STOP')
 
-    def read_channel(self, channel=1):
+    def _channel_name(self, channel):
         if isinstance(channel, int):
             channel = f'CH{channel}'
+        return channel
+
+    def _read_preamble(self):
+        # Returns t_inc, t_off, V_inc, V_off for the current source
+        V_inc, V_off, t_inc, t_off = map(float,
+            self.inst.ask('WFMO:YMU?;YOF?;XIN?;XZE?').split(';'))
+        return t_inc, t_off, V_inc, V_off
 
-        self.inst.write('DATA INIT')
-        self.inst.write('DATA:SOU ' + channel)
+    def _read_scale(self):
+        # Only the vertical scale differs between channels, which is much
+        #   quicker to query than the full preamble
+        V_inc, V_off = self.inst.ask('WFMO:YMU?;YOF?').split(';')
+        return float(V_inc), float(V_off)
 
-        fmt = self.inst.ask('WFMO?').split(';')
-        dtype = ('i' if fmt[3] == 'RI' else 'u') + fmt[0]        
-        t_inc = float(fmt[9])
-        t_off = float(fmt[10])
-        V_inc = float(fmt[13])
-        V_off = float(fmt[14])
+    def _read_curve(self):
         self.inst.write('CURV?')
-        raw = self.inst.read_raw()
+        return convert_raw(self.inst.read_raw(), self._dtype)
+
+    def read_channel(self, channel=1):
+        self.inst.write('DATA:SOU ' + self._channel_name(channel))
+
+        t_inc, t_off, V_inc, V_off = self._read_preamble()
+        raw = self._read_curve()
         self.error_byte()
 
-        V = (convert_raw(raw, dtype) - V_off) * V_inc
+        V = scale_raw(raw, V_inc, V_off)
         t = np.arange(len(V)) * t_inc + t_off
 
         return t, V
-    
+
     def read_channels(self, channels):
         running = self.is_running()
 
@@ -80,20 +127,41 @@ class TBS2000B:
             self.stop()
 
         output = []
+        channels = [self._channel_name(channel) for channel in channels]
 
-        for channel in channels:
-            t, V = self.read_channel(channel)
-            
-            if not output:
-                output.append(t)
-            
-            output.append(V)
+        # The time axis is the same for every channel, so the full preamble
+        #   is only read once
+        # Each channel is scaled in a worker thread, which overlaps with
+        #   reading the next channel from the scope
+        futures = []
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            for i, channel in enumerate(channels):
+                self.inst.write('DATA:SOU ' + channel)
+
+                if not output:
+                    t_inc, t_off, V_inc, V_off = self._read_preamble()
+                else:
+                    V_inc, V_off = self._read_scale()
+
+                raw = self._read_curve()
+
+                if not output:
+                    output.append(np.arange(len(raw)) * t_inc + t_off)
+                    # All channels are written into a single block of memory
+                    V = np.empty((len(channels), len(raw)), dtype='f4')
+
+                futures.append(pool.submit(scale_raw, raw, V_inc, V_off, out=V[i]))
+
+            output += [future.result() for future in futures]
+
+        # A single error check covers the whole acquisition
+        self.error_byte()
 
         if running:
             self.run()
 
         return tuple(output)
-    
+
     def __bool__(self):
         return True
 
@@ -104,9 +172,7 @@ def get_oscope(inst):
 
     idn = inst.ask('*IDN?')
 
-    if re.match('TEKTRONIX,TBS(2\d\d2)B', idn):
+    if _IDN_RE.match(idn):
         return TBS2000B(inst)
     else:
         raise ValueError(f"Unkonwn Oscilloscope ID: '{idn}'")
-
-    return idn
@@ -1,13 +1,36 @@
 from . import *
-import matplotlib
-matplotlib.use('Qt5Agg')
-
 from PyQt5 import QtCore, QtWidgets, QtGui
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
 import traceback
 import time
 
+def fit_data(data, harmonics=5):
+    '''Fit the reference and signal channels of a data set.
+
+    Parameters
+    ----------
+    data : (t, V_ref, V_sig) arrays
+    harmonics : number of harmonics to extract from the signal (default: 5)
+
+    Returns
+    -------
+    result : dictionary of the Harmonics (from find_harmonics), the fitted
+             curves and the signal offset.
+    '''
+    t, ref, sig = data
+    d = find_harmonics(t, ref, sig, harmonics)
+
+    ref_fit = cosine_fit(t, d.ref_offset, d.ref_A, d.omega[0], d.phi[0])
+    sig_fit = harmonic_reconstruct(t, d)
+
+    return {
+        'harmonics': d,
+        'ref_fit': ref_fit,
+        # Reference fit rescaled to the range [0, 1]
+        'ref_fit1': 0.5 + (ref_fit - d.ref_offset) / (2 * d.ref_A),
+        'sig_fit': sig_fit,
+        'sig_offset': (sig - sig_fit).mean(),
+    }
+
 class Tabs(QtWidgets.QTabWidget):
     def __init__(self, parent):
         super().__init__(parent)
@@ -15,9 +38,11 @@ class Tabs(QtWidgets.QTabWidget):
         self.setTabsClosable(True)
         self.tabCloseRequested.connect(self.remove_tab)
 
-    def add_tab(self, widget, title):
+    def add_tab(self, widget, title, select=True):
         self.pages.append(widget)
-        self.setCurrentIndex(self.addTab(self.pages[-1], title))
+        index = self.addTab(self.pages[-1], title)
+        if select:
+            self.setCurrentIndex(index)
 
     def remove_tab(self, index):
         self.removeTab(index)
@@ -26,14 +51,48 @@ class Tabs(QtWidgets.QTabWidget):
     def current_tab(self):
         return self.pages[self.currentIndex()]
 
+class FitSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(dict)
+    failed = QtCore.pyqtSignal(str)
+
+class FitWorker(QtCore.QRunnable):
+    def __init__(self, data, harmonics=5):
+        super().__init__()
+        self.data = data
+        self.harmonics = harmonics
+        self.signals = FitSignals()
+
+    def run(self):
+        try:
+            result = fit_data(self.data, self.harmonics)
+        except Exception as e:
+            self.signals.failed.emit(f'{e.__class__.__name__}: {e}')
+        else:
+            self.signals.done.emit(result)
+
+# numba's parallel kernels can't safely be called from several threads at
+#   once, so fits are run one at a time on their own thread pool
+FIT_POOL = QtCore.QThreadPool()
+FIT_POOL.setMaxThreadCount(1)
+
 class DataDisplay(QtWidgets.QSplitter):
     def __init__(self, parent, data, harmonics=5):
         super().__init__(parent)
         self.setOrientation(QtCore.Qt.Vertical)
         self.layout = QtWidgets.QVBoxLayout(self)
 
+        # matplotlib is slow to import, so wait until a plot is needed
+        import matplotlib
+        matplotlib.use('Qt5Agg')
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+        from matplotlib.figure import Figure
+
         self.fig = Figure()
         self.fig_canvas = FigureCanvasQTAgg(self.fig)
+        self.fig_canvas.mpl_connect('draw_event', self.save_background)
+        self.plot_axes = {}
+        self.plot_backgrounds = {}
+        self.plot_view = None
 
         # self.splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
         self.addWidget(self.fig_canvas)
@@ -49,6 +108,10 @@ class DataDisplay(QtWidgets.QSplitter):
 
         self.data = data
         self.num_harmonics = harmonics
+        self._scaled_t = {}
+        # Time units for each view; the detail view is added once the
+        #   period is known
+        self.t_scales = {'wide': self.time_scale(data[0].max() - data[0].min())}
 
         if len(data) != 3:
             self.layout.addWidget(
@@ -58,8 +121,6 @@ class DataDisplay(QtWidgets.QSplitter):
             self.detail_plot = False
 
         else:
-            self.detail_plot = True
-
             layout = QtWidgets.QHBoxLayout()
 
             self.button_detail = QtWidgets.QRadioButton("Detailed signal view")
@@ -75,59 +136,129 @@ class DataDisplay(QtWidgets.QSplitter):
 
             self.layout.addLayout(layout)
 
-            self.harmonics = find_harmonics(data[0], data[1], data[2], self.num_harmonics)
-
-            self.ref_fit = cosine_fit(data[0], *(self.harmonics[l] for l in ('ref offset', 'ref A', 'ref ω', 'ref ϕ')))
-            self.ref_fit1 = cosine_fit(data[0], 0.5, 0.5, *(self.harmonics[l] for l in ('ref ω', 'ref ϕ')))
-            self.sig_fit = harmonic_reconstruct(data[0], self.harmonics)
-            self.sig_offset = (self.data[2] - self.sig_fit).mean()
-
-            self.table = QtWidgets.QTableWidget(self.num_harmonics+1, 5, self)
-            self.layout.addWidget(self.table)
-            self.table.setHorizontalHeaderLabels(
-                ['Frequency', 'Amplitude', 'Phase Delay', 'Phase Delay (deg)', 'Delay']
-            )
-            self.table.setVerticalHeaderLabels(
-                ['Reference', 'Fundamental'] +
-                [f'Harmonic {n}' for n in range(2, self.num_harmonics+1)]
-            )
+            # Fitting is done in a background thread to keep the GUI
+            #   responsive; results are filled in by populate.
+            self.detail_plot = False
+            self.button_detail.setEnabled(False)
+            self.button_wide.setEnabled(False)
+
+            self.busy = QtWidgets.QProgressBar()
+            self.busy.setRange(0, 0)
+            self.layout.addWidget(self.busy)
+
+        # The fit and plot are done when the tab is first shown, so opening
+        #   several files at once only blocks for the one being looked at
+        self._built = False
+        self.fitting = False
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self._built:
+            self._built = True
+            self._build_analysis()
+
+    def _build_analysis(self):
+        if len(self.data) == 3:
+            if HAS_NUMBA:
+                # Start numba's threads from the GUI thread; if they are first
+                #   started by a fit, the application hangs on exit
+                numba.get_num_threads()
+
+            worker = FitWorker(self.data, self.num_harmonics)
+            worker.signals.done.connect(self.populate)
+            worker.signals.failed.connect(self.fit_failed)
+            self.fit_signals = worker.signals
+            self.fitting = True
+            FIT_POOL.start(worker)
 
-            ω, A, ϕ = [self.harmonics[f'ref {l}'] for l in ("ω", "A", "ϕ")]
-            self.period = 2*π / ω
-            ϕ = (-ϕ) % (2*π)
-
-            # FFT bin size is 1 / Δt -- assume our actual error is 10% of this
-            freq_precision = 0.1 / (self.data[0][-1] - self.data[0][0])
-            # print(freq_precision)
-            freq_sigfigs = int(np.ceil(np.log10(ω / (2*π) / freq_precision)))
-
-            self.table.setItem(0, 0, QtWidgets.QTableWidgetItem(SI_format(ω / (2*π), 'Hz', freq_sigfigs)))
-            self.table.setItem(0, 1, QtWidgets.QTableWidgetItem(SI_format(A, 'V')))
-            self.table.setItem(0, 2, QtWidgets.QTableWidgetItem(f'({ϕ:.3f} rad)'))
-            self.table.setItem(0, 3, QtWidgets.QTableWidgetItem(f'({ϕ * 180/π:.1f}°)'))
-            self.table.setItem(0, 4, QtWidgets.QTableWidgetItem(f'({SI_format(ϕ/ω, "s")})'))
-            self.ref_delay = ϕ/ω
-
-            for n in range(1, self.num_harmonics+1):
-                ω, A, ϕ = [self.harmonics[f'{l}{n}'] for l in ("ω", "A", "ϕ")]
-                ϕ = (-ϕ) % (2*π)
-                if n == 1:
-                    self.fund_delay = ϕ/ω
-                self.table.setItem(n, 0, QtWidgets.QTableWidgetItem(SI_format(ω / (2*π), 'Hz', freq_sigfigs)))
-                self.table.setItem(n, 1, QtWidgets.QTableWidgetItem(SI_format(A, 'V')))
-                self.table.setItem(n, 2, QtWidgets.QTableWidgetItem(f'{ϕ:.3f} rad'))
-                self.table.setItem(n, 3, QtWidgets.QTableWidgetItem(f'{ϕ * 180/π:.1f}°'))
-                item = QtWidgets.QTableWidgetItem(SI_format(ϕ/ω, "s"))
-                self.table.setItem(n, 4, item)
-                if n == 1:
-                    item.setForeground(QtGui.QBrush(QtCore.Qt.red))
-
-            note = QtWidgets.QLabel("Note: reference delay mesaured relative to trigger (t=0); other delays mesaured relative to reference signal peak!")
-            note.setWordWrap(True)
-            self.layout.addWidget(note)
+        self.draw_plot()
 
+    def populate(self, result):
+        self.fitting = False
+        self.busy.deleteLater()
+
+        self.harmonics = result['harmonics']
+        self.ref_fit = result['ref_fit']
+        self.ref_fit1 = result['ref_fit1']
+        self.sig_fit = result['sig_fit']
+        self.sig_offset = result['sig_offset']
+
+        # A view on a model is populated in one go, instead of relaying out
+        #   a QTableWidget for every item
+        self.table = QtWidgets.QTableView(self)
+        self.layout.addWidget(self.table)
+        model = QtGui.QStandardItemModel(self.num_harmonics+1, 5, self.table)
+        model.setHorizontalHeaderLabels(
+            ['Frequency', 'Amplitude', 'Phase Delay', 'Phase Delay (deg)', 'Delay']
+        )
+        model.setVerticalHeaderLabels(
+            ['Reference', 'Fundamental'] +
+            [f'Harmonic {n}' for n in range(2, self.num_harmonics+1)]
+        )
+
+        h = self.harmonics
+        ω, A, ϕ = h.omega[0], h.A[0], h.phi[0]
+        self.period = 2*π / ω
+        ϕ = (-ϕ) % (2*π)
+
+        # FFT bin size is 1 / Δt -- assume our actual error is 10% of this
+        freq_precision = 0.1 / (self.data[0][-1] - self.data[0][0])
+        # print(freq_precision)
+        freq_sigfigs = int(np.ceil(np.log10(ω / (2*π) / freq_precision)))
+
+        rows = [[
+            SI_format(ω / (2*π), 'Hz', freq_sigfigs),
+            SI_format(A, 'V'),
+            f'({ϕ:.3f} rad)',
+            f'({ϕ * 180/π:.1f}°)',
+            f'({SI_format(ϕ/ω, "s")})'
+        ]]
+        self.ref_delay = ϕ/ω
+        self.t_scales['detail'] = self.time_scale(self.period)
+
+        ω, A, ϕ = h.omega[1:], h.A[1:], h.phi[1:]
+        ϕ = (-ϕ) % (2*π)
+        delay = ϕ/ω
+        self.fund_delay = delay[0]
+
+        rows += [[
+            SI_format(ω[i] / (2*π), 'Hz', freq_sigfigs),
+            SI_format(A[i], 'V'),
+            f'{ϕ[i]:.3f} rad',
+            f'{ϕ[i] * 180/π:.1f}°',
+            SI_format(delay[i], "s")
+        ] for i in range(self.num_harmonics)]
+
+        self.table.setUpdatesEnabled(False)
+        model.blockSignals(True)
+        for i, row in enumerate(rows):
+            for j, text in enumerate(row):
+                model.setItem(i, j, QtGui.QStandardItem(text))
+        model.item(1, 4).setForeground(QtGui.QBrush(QtCore.Qt.red))
+        model.blockSignals(False)
+        self.table.setModel(model)
+        self.table.setUpdatesEnabled(True)
+
+        note = QtWidgets.QLabel("Note: reference delay mesaured relative to trigger (t=0); other delays mesaured relative to reference signal peak!")
+        note.setWordWrap(True)
+        self.layout.addWidget(note)
+
+        self.button_detail.setEnabled(True)
+        self.button_wide.setEnabled(True)
+        self.button_detail.setChecked(True)
+        self.detail_plot = True
+        # The wide view may already be built; if so the fit is added to it,
+        #   rather than rebuilding the figure
+        if 'wide' in self.plot_axes:
+            self.plot_wide_fit(self.plot_axes['wide'])
+            self.plot_backgrounds.pop('wide', None)
         self.draw_plot()
 
+    def fit_failed(self, message):
+        self.fitting = False
+        self.busy.deleteLater()
+        self.layout.addWidget(QtWidgets.QLabel(f'Fitting failed! {message}'))
+
     def save_csv(self, fn):
         args = [fn, self.data]
         if hasattr(self, 'harmonics'):
@@ -142,77 +273,105 @@ class DataDisplay(QtWidgets.QSplitter):
         self.detail_plot = False
         self.draw_plot()
 
-    def draw_plot(self):
-        self.fig.clear()
-        # self.axes = self.fig.add_subplot(111)
-        self.axes = self.fig.add_axes([0.15, 0.2, 0.8, 0.75])
-
-        if getattr(self, 'detail_plot', False):
-            self.t_prefix, self.t_div = get_prefix(self.period)
-            if self.t_prefix is None:
-                self.t_prefix = ""
+    def time_scale(self, x):
+        prefix, div = get_prefix(x)
+        return ("" if prefix is None else prefix), div
 
-            self.axes.set_xlabel(f'time ({self.t_prefix}s)')
-            self.t = self.data[0] / self.t_div
+    def scaled_time(self, div, offset=0):
+        # (t - offset) / div, cached so that switching views doesn't need to
+        #   recompute it
+        key = (div, offset)
+        if key not in self._scaled_t:
+            self._scaled_t[key] = (self.data[0] - offset) / div
+        return self._scaled_t[key]
 
-            # self.axes.plot(self.t, self.ref_fit)
-            # self.axes.plot(self.t, self.sig_fit)
+    def draw_plot(self):
+        view = 'detail' if getattr(self, 'detail_plot', False) else 'wide'
+        self.plot_view = view
+        self.t_prefix, self.t_div = self.t_scales[view]
+        self.t = self.scaled_time(self.t_div, self.ref_delay if view == 'detail' else 0)
 
-            self.t_prefix, self.t_div = get_prefix(self.period)
-            if self.t_prefix is None:
-                self.t_prefix = ""
-            self.t = self.data[0] / self.t_div
+        # Each view has its own axes, which are only built the first time
+        #   they are shown; after that switching views toggles visibility.
+        if view not in self.plot_axes:
+            # self.axes = self.fig.add_subplot(111)
+            self.axes = self.fig.add_axes([0.15, 0.2, 0.8, 0.75], label=view)
+            self.plot_axes[view] = self.axes
 
-            t1 = self.ref_delay / self.t_div
-            self.t -= t1
-            t2 = self.fund_delay / self.t_div
+            if view == 'detail':
+                # self.axes.plot(self.t, self.ref_fit)
+                # self.axes.plot(self.t, self.sig_fit)
 
-            t0 = -2.5*self.period / self.t_div
+                t2 = self.fund_delay / self.t_div
 
+                t0 = -2.5*self.period / self.t_div
 
-            if t0 < self.t[0]:
-                t0 = self.t[0]
 
+                if t0 < self.t[0]:
+                    t0 = self.t[0]
 
+                t3 = t0 + 5*self.period/self.t_div
 
-            # self.axes.plot(self.t, self.data[1], '.')
+                # Only the visible part of the data needs to be plotted
+                i0, i1 = np.searchsorted(self.t, [t0, t3])
+                vis = slice(max(i0 - 1, 0), i1 + 1)
+                t = self.t[vis]
 
-            # offset = self.data[2].mean()
-            self.axes.plot(self.t, self.data[2] - self.sig_offset, '.', color='C1')
-            # self.axes.plot(self.t, self.ref_fit)
-            self.axes.plot(self.t, self.sig_fit, 'k--')
 
-            yl = self.axes.get_ylim()
-            self.axes.plot([0, 0], yl, 'k:', zorder=-1)
-            self.axes.plot([t2, t2], yl, 'r-', zorder=-1)
-            self.axes.plot(self.t, (self.ref_fit1 * (yl[1] - yl[0])) + yl[0], color='C0', alpha=0.5, zorder=-1)
 
+                # self.axes.plot(self.t, self.data[1], '.')
 
-            self.axes.set_ylim(*yl)
-            self.axes.set_xlim(t0, t0 + 5*self.period/self.t_div)
-            self.axes.set_xlabel(f'delay time, relative to reference ({self.t_prefix}s)')
-            self.axes.set_ylabel(f'voltage (V)')
+                # offset = self.data[2].mean()
+                self.axes.plot(*minmax_decimate(t, self.data[2][vis] - self.sig_offset), '.', color='C1')
+                # self.axes.plot(self.t, self.ref_fit)
+                self.axes.plot(*minmax_decimate(t, self.sig_fit[vis]), 'k--')
 
-        else:
-            self.t_prefix, self.t_div = get_prefix(self.data[0].max() - self.data[0].min())
-            if self.t_prefix is None:
-                self.t_prefix = ""
+                yl = self.axes.get_ylim()
+                self.axes.plot([0, 0], yl, 'k:', zorder=-1)
+                self.axes.plot([t2, t2], yl, 'r-', zorder=-1)
+                self.axes.plot(*minmax_decimate(t, (self.ref_fit1[vis] * (yl[1] - yl[0])) + yl[0]), color='C0', alpha=0.5, zorder=-1)
 
-            self.axes.set_xlabel(f'time ({self.t_prefix}s)')
-            self.t = self.data[0] / self.t_div
-            self.axes.set_ylabel(f'voltage (V)')
 
-            for i in range(1, len(self.data)):
-                label = {1: "reference", 2:"signal"}.get(i, None)
-                self.axes.plot(self.t, self.data[i], '.', label=label)
+                self.axes.set_ylim(*yl)
+                self.axes.set_xlim(t0, t3)
+                self.axes.set_xlabel(f'delay time, relative to reference ({self.t_prefix}s)')
+                self.axes.set_ylabel(f'voltage (V)')
 
-            if hasattr(self, 'ref_fit'):
-                self.axes.plot(self.t, self.ref_fit, 'k-', label='fit')
-                self.axes.plot(self.t, self.sig_fit + self.sig_offset, 'k-')
+            else:
+                self.axes.set_xlabel(f'time ({self.t_prefix}s)')
+                self.axes.set_ylabel(f'voltage (V)')
+
+                for i in range(1, len(self.data)):
+                    label = {1: "reference", 2:"signal"}.get(i, None)
+                    self.axes.plot(*minmax_decimate(self.t, self.data[i]), '.', label=label)
+
+                if hasattr(self, 'ref_fit'):
+                    self.plot_wide_fit(self.axes)
+
+        self.axes = self.plot_axes[view]
+        for v, axes in self.plot_axes.items():
+            axes.set_visible(v == view)
+
+        # If this view was already rendered at the current size, blit the
+        #   saved image rather than redrawing the whole figure
+        size, background = self.plot_backgrounds.get(view, (None, None))
+        if size == self.fig_canvas.get_width_height():
+            self.fig_canvas.restore_region(background)
+            self.fig_canvas.blit(self.fig.bbox)
+        else:
+            self.fig_canvas.draw_idle()
 
-                self.axes.legend()
+    def plot_wide_fit(self, axes):
+        t = self.scaled_time(self.t_scales['wide'][1])
+        axes.plot(*minmax_decimate(t, self.ref_fit), 'k-', label='fit')
+        axes.plot(*minmax_decimate(t, self.sig_fit + self.sig_offset), 'k-')
+        axes.legend()
 
-        self.fig_canvas.draw()
+    def save_background(self, event):
+        self.plot_backgrounds[self.plot_view] = (
+            self.fig_canvas.get_width_height(),
+            self.fig_canvas.copy_from_bbox(self.fig.bbox)
+        )
 
 
 def error_popup(e, ok=False):
@@ -220,7 +379,7 @@ def error_popup(e, ok=False):
     if isinstance(e, str):
         title = "error"
         text = e
-        detail = none
+        detail = None
     else:
         ec = e.__class__.__name__
         title = str(ec)
@@ -321,21 +480,27 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     def open_file(self):
-        fn, ext = QtWidgets.QFileDialog.getOpenFileName(self, 'Open Data',
+        fns, ext = QtWidgets.QFileDialog.getOpenFileNames(self, 'Open Data',
             os.getcwd(), "CSV (*.csv)")
-        if fn:
-            self.load_file(fn)
+        # Only the first file is brought to the front; the rest are opened in
+        #   background tabs, which aren't fitted until they are selected
+        for i, fn in enumerate(fns):
+            self.load_file(fn, select=(i == 0))
 
-    def load_file(self, fn):
+    def load_file(self, fn, select=True):
         try:
             data = load_osc_csv(fn)
         except Exception as e:
             error_popup(e)
         else:
             display = DataDisplay(self, data)
-            self.tabs.add_tab(display, os.path.split(fn)[1])
+            self.tabs.add_tab(display, os.path.split(fn)[1], select)
 
     def save_file(self):
+        if self.tabs.current_tab().fitting:
+            error_popup("Fit still running; wait for it to finish before saving.")
+            return
+
         fn, ext = QtWidgets.QFileDialog.getSaveFileName(self, 'Save CSV Data',
             os.getcwd(), "CSV (*.csv)")
         if fn: